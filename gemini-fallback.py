@@ -4,101 +4,1164 @@ Gemini Model Fallback Handler
 할당량 초과 시 자동으로 다른 모델로 전환하고 인계 시스템
 """
 
+from __future__ import annotations
+
 import subprocess
+import argparse
+import atexit
+import datetime as _dt
+import functools
+import hashlib
+import importlib.util
 import json
+import logging
+import os
+import random
+import re
+import selectors
+import shlex
 import sys
+import threading
 import time
-from typing import List, Dict, Optional
+from collections import deque
+from typing import (IO, TYPE_CHECKING, Any, Callable, ClassVar, Coroutine, Deque, Dict,
+                    FrozenSet, Generator, List, Optional, Protocol, Set, Tuple, TypeGuard,
+                    cast)
+from zoneinfo import ZoneInfo
+
+# 어노테이션 전용 (mypyc는 TYPE_CHECKING의 else 분기를 도달 불가 코드로 컴파일하므로 else 없이 둠)
+if TYPE_CHECKING:
+    from asyncio import AbstractEventLoop, Future, Queue, Task
+    from numpy import ndarray
+
+# 시맨틱 캐시용 선택 의존성 (import만 수십 ms라 SemanticCache 생성 시 로딩)
+np: Any = None
+
+# PromptBatcher 전용 (CLI 기본 경로에서는 쓰지 않으므로 생성 시 로딩)
+asyncio: Any = None
+
+
+def _import_asyncio() -> None:
+    global asyncio
+    if asyncio is None:
+        asyncio = importlib.import_module("asyncio")
+
+
+def _import_numpy() -> None:
+    global np
+    if np is None:
+        try:
+            np = importlib.import_module("numpy")
+        except ImportError:
+            raise ImportError("SemanticCache requires numpy (pip install numpy)") from None
+
+try:
+    from pybloom_live import ScalableBloomFilter  # type: ignore[import-not-found,import-untyped]
+except ImportError:  # pragma: no cover
+    ScalableBloomFilter = None  # type: ignore[assignment,misc]
+
+# 캐시 키 직렬화용 선택 의존성 (C 확장, 표준 json보다 빠름)
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore[assignment]
+
+
+def _dumps(obj: Any) -> bytes:
+    """키 정렬 JSON 직렬화 (orjson 유무와 관계없이 같은 바이트 출력)"""
+    try:
+        if orjson is not None:
+            return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+        return json.dumps(obj, sort_keys=True, ensure_ascii=False,
+                          separators=(",", ":")).encode("utf-8")
+    except (TypeError, UnicodeEncodeError):
+        # 짝 없는 서로게이트 (비 UTF-8 argv 등)는 UTF-8로 인코딩할 수 없으므로 ASCII 이스케이프
+        return json.dumps(obj, sort_keys=True, separators=(",", ":")).encode("ascii")
+
+_log = logging.getLogger("gemini_fallback")
+
+# 할당량은 매일 태평양 시간 자정에 리셋됨
+_PT = ZoneInfo("America/Los_Angeles")
+
+_BANNER_TEMPLATE = """
+╔══════════════════════════════════════════════════════════╗
+║  🔴 GEMINI MODEL FALLBACK - MASTER AGENT NOTIFICATION           ║
+╚══════════════════════════════════════════════════════════╝
+
+All Gemini models have been exhausted after {cycles} cycle(s).
+
+Current Status:
+  - Last attempted model: {model}
+  - Total models tried: {model_count}
+  - Retry attempts per model: {max_retries}
+  - Last error: {last_error}...
+
+Recommendations:
+  1. Check API key quota at https://aistudio.google.com/app/apikey
+  2. Wait for quota reset (daily at midnight Pacific Time)
+  3. Upgrade to paid plan for higher limits
+  4. Consider using Claude directly (which you're using now!)
+
+Time until reset: Approximately {hours_until_reset:.1f} hours
+
+Fallback system terminating. Master agent (Claude) should handle this task.
+"""
+
+
+class CacheBackend(Protocol):
+    """LLMCache 저장소 인터페이스"""
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]: ...
+
+    def set(self, key: str, entry: Dict[str, Any]) -> None: ...
+
+    def delete(self, key: str) -> None: ...
+
+
+class MemoryCacheBackend:
+    """프로세스 메모리 캐시 백엔드 (기본값)"""
+
+    def __init__(self) -> None:
+        self._store: Dict[str, Dict[str, Any]] = {}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._store.get(key)
+
+    def set(self, key: str, entry: Dict[str, Any]) -> None:
+        self._store[key] = entry
+
+    def delete(self, key: str) -> None:
+        self._store.pop(key, None)
+
+
+class FileCacheBackend:
+    """디스크 캐시 백엔드 (~/.cache/gemini-fallback/<hash>.json)"""
+
+    DEFAULT_DIR: ClassVar[str] = os.path.join(os.path.expanduser("~"), ".cache", "gemini-fallback")
+
+    def __init__(self, directory: Optional[str] = None) -> None:
+        self.directory = directory or self.DEFAULT_DIR
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key: str, entry: Dict[str, Any]) -> None:
+        # 임시 파일에 쓴 뒤 교체해 동시 실행 중 깨진 파일을 읽지 않도록 함
+        tmp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            pass
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+
+class LLMCache:
+    """(모델, 프롬프트) 해시 기반 응답 캐시"""
+
+    DEFAULT_TTL: ClassVar[int] = 3600
+
+    def __init__(self, backend: Optional[CacheBackend] = None) -> None:
+        """
+        초기화
+
+        Args:
+            backend: get/set/delete를 제공하는 저장소 (기본: 메모리)
+        """
+        self.backend: CacheBackend = backend if backend is not None else MemoryCacheBackend()
+
+    @staticmethod
+    def make_key(model: str, prompt: str) -> str:
+        """캐시 키 생성"""
+        return hashlib.sha256(_dumps({"model": model, "prompt": prompt})).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """캐시된 결과 반환 (없거나 만료됐거나 캐시 항목 형식이 아니면 None)"""
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        expires_at = entry.get("expires_at") if isinstance(entry, dict) else None
+        if (not isinstance(expires_at, (int, float))
+                or not isinstance(entry.get("value"), dict)
+                or expires_at < time.time()):
+            self.backend.delete(key)
+            return None
+        return entry["value"]
+
+    def set(self, key: str, value: Dict, ttl: int = DEFAULT_TTL) -> None:
+        """결과 저장"""
+        self.backend.set(key, {"value": value, "expires_at": time.time() + ttl})
+
+    def lookup(self, model: str, prompt: str) -> Optional[Dict]:
+        """(모델, 프롬프트)로 캐시 조회"""
+        return self.get(self.make_key(model, prompt))
+
+    def store(self, model: str, prompt: str, value: Dict,
+              ttl: int = DEFAULT_TTL) -> None:
+        """(모델, 프롬프트)로 결과 저장"""
+        self.set(self.make_key(model, prompt), value, ttl=ttl)
+
+
+class SemanticCache(LLMCache):
+    """
+    임베딩 유사도 기반 캐시
+
+    정확히 일치하는 키가 없으면 같은 모델로 캐시된 프롬프트 중
+    코사인 유사도가 임계값 이상인 가장 가까운 항목을 반환한다.
+    임베딩은 행별 스케일과 함께 int8로 양자화해 보관한다 (메모리/디스크 1/4).
+    점수 계산은 캐시에 들어가는 블록 단위로 float32로 되돌려 BLAS로 수행한다
+    (변환 비용 때문에 float32 행렬을 그대로 곱하는 것보다는 조금 느림).
+    """
+
+    DEFAULT_THRESHOLD: ClassVar[float] = 0.92
+    DEFAULT_EMBED_MODEL: ClassVar[str] = "all-MiniLM-L6-v2"
+
+    # 블룸 필터 사전 검사: 3글자 shingle 중 최소 BLOOM_MIN_HITS개가 있어야 임베딩 조회
+    SHINGLE_SIZE: ClassVar[int] = 3
+    BLOOM_MIN_HITS: ClassVar[int] = 5
+    BLOOM_CAPACITY: ClassVar[int] = 1000
+    BLOOM_ERROR_RATE: ClassVar[float] = 0.01
+
+    # 점수 계산 시 한 번에 float32로 되돌리는 행 수 (D=384면 임시 버퍼 768KB)
+    SCORE_BLOCK_ROWS: ClassVar[int] = 512
+
+    def __init__(self, backend: Optional[CacheBackend] = None,
+                 embedder: Optional[Callable[[str], Any]] = None,
+                 threshold: float = DEFAULT_THRESHOLD,
+                 index_dir: Optional[str] = None,
+                 bloom: bool = False) -> None:
+        """
+        초기화
+
+        Args:
+            backend: 정확 일치 캐시 저장소 (기본: 메모리)
+            embedder: 문자열 → 벡터 함수 (기본: sentence-transformers)
+            threshold: 캐시 적중으로 인정할 최소 코사인 유사도
+            index_dir: 임베딩 인덱스 저장 디렉터리 (None이면 저장 안 함)
+            bloom: True면 블룸 필터로 확실한 미스를 임베딩 계산 전에 걸러냄
+        """
+        _import_numpy()
+        if bloom and ScalableBloomFilter is None:
+            raise ImportError("Bloom pre-check requires pybloom-live (pip install pybloom-live)")
+        if embedder is None and importlib.util.find_spec("sentence_transformers") is None:
+            raise ImportError(
+                "SemanticCache requires sentence-transformers "
+                "(pip install sentence-transformers) or a custom embedder"
+            )
+
+        super().__init__(backend)
+        self.threshold = threshold
+        self.index_dir = index_dir
+        self._embedder = embedder
+        self.semantic_hits = 0
+        # 모델별 조회와 이어지는 store()가 같은 프롬프트를 다시 임베딩하지 않도록 재사용
+        self._last_embedding: Optional[Tuple[str, ndarray]] = None
+
+        # 정규화 후 int8 양자화한 행 (N, D) + 행별 스케일/캐시 키/모델 ID
+        self._emb_q: Optional[ndarray] = None
+        self._emb_scale = np.empty(0, dtype=np.float32)
+        self._emb_keys: List[str] = []
+        self._emb_prompts: List[Optional[str]] = []
+        self._emb_model_ids = np.empty(0, dtype=np.int32)
+        self._model_ids: Dict[str, int] = {}
+
+        # 필터가 모든 행을 담지 못하면(프롬프트 없는 옛 인덱스) 사전 검사를 건너뜀
+        self._bloom: Any = None
+        self._bloom_complete = True
+        if bloom:
+            self._bloom = ScalableBloomFilter(initial_capacity=self.BLOOM_CAPACITY,
+                                              error_rate=self.BLOOM_ERROR_RATE)
+
+        if index_dir:
+            self._load_index()
+
+    @classmethod
+    def _shingles(cls, prompt: str) -> Set[str]:
+        """정규화된 프롬프트의 n글자 shingle 집합"""
+        text = " ".join(prompt.lower().split())
+        n = cls.SHINGLE_SIZE
+        return {text[i:i + n] for i in range(max(1, len(text) - n + 1))}
+
+    def _bloom_rejects(self, prompt: str) -> bool:
+        """블룸 필터상 유사 프롬프트가 확실히 없으면 True"""
+        if self._bloom is None or not self._bloom_complete:
+            return False
+        shingles = self._shingles(prompt)
+        needed = min(self.BLOOM_MIN_HITS, len(shingles))
+        hits = 0
+        for shingle in shingles:
+            if shingle in self._bloom:
+                hits += 1
+                if hits >= needed:
+                    return False
+        return True
+
+    def _embed(self, text: str) -> ndarray:
+        """정규화된 임베딩 벡터 계산"""
+        if self._last_embedding is not None and self._last_embedding[0] == text:
+            return self._last_embedding[1]
+        if self._embedder is None:
+            # 모델 로딩이 무거우므로 첫 사용 시점까지 미룸
+            from sentence_transformers import SentenceTransformer  # type: ignore[import-not-found]
+            self._embedder = SentenceTransformer(self.DEFAULT_EMBED_MODEL).encode
+
+        vec = np.asarray(self._embedder(text), dtype=np.float32).ravel()
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec = vec / norm
+        self._last_embedding = (text, vec)
+        return vec
+
+    @staticmethod
+    def _quantize(rows: ndarray) -> Tuple[ndarray, ndarray]:
+        """행별 대칭 int8 양자화 → (int8 행렬, float32 스케일)"""
+        scale = np.abs(rows).max(axis=1) / 127
+        scale[scale == 0] = 1.0
+        q = np.round(rows / scale[:, np.newaxis]).astype(np.int8)
+        return q, scale.astype(np.float32)
+
+    def _model_id(self, model: str) -> int:
+        return self._model_ids.setdefault(model, len(self._model_ids))
+
+    def lookup(self, model: str, prompt: str) -> Optional[Dict]:
+        """정확 일치 조회 후 실패하면 최근접 임베딩 조회"""
+        value = super().lookup(model, prompt)
+        if value is not None or self._emb_q is None:
+            return value
+
+        model_id = self._model_ids.get(model)
+        if model_id is None or self._bloom_rejects(prompt):
+            return None
+
+        sims = self._scores(self._embed(prompt))
+        sims[self._emb_model_ids != model_id] = -1.0
+        best = int(sims.argmax())
+        if sims[best] < self.threshold:
+            return None
+
+        value = self.get(self._emb_keys[best])
+        if value is not None:
+            self.semantic_hits += 1
+        return value
+
+    def _scores(self, query: ndarray) -> ndarray:
+        """모든 행과 정규화된 쿼리의 코사인 유사도
+
+        NumPy 정수 matmul은 BLAS를 쓰지 않아 float32보다 수 배 느리므로
+        int8 행을 블록마다 float32로 되돌려 곱한다.
+        """
+        assert self._emb_q is not None
+        sims = np.empty(len(self._emb_q), dtype=np.float32)
+        step = self.SCORE_BLOCK_ROWS
+        for start in range(0, len(self._emb_q), step):
+            block = self._emb_q[start:start + step].astype(np.float32)
+            np.multiply(block @ query, self._emb_scale[start:start + step],
+                        out=sims[start:start + step])
+        return sims
+
+    def store(self, model: str, prompt: str, value: Dict,
+              ttl: int = LLMCache.DEFAULT_TTL) -> None:
+        """결과 저장 및 임베딩 인덱스에 행 추가"""
+        key = self.make_key(model, prompt)
+        self.set(key, value, ttl=ttl)
+
+        q_row, scale = self._quantize(self._embed(prompt)[np.newaxis, :])
+        if self._emb_q is None:
+            self._emb_q = q_row
+        else:
+            self._emb_q = np.vstack([self._emb_q, q_row])
+        self._emb_scale = np.append(self._emb_scale, scale)
+        self._emb_keys.append(key)
+        self._emb_prompts.append(prompt)
+        self._emb_model_ids = np.append(self._emb_model_ids,
+                                        np.int32(self._model_id(model)))
+        if self._bloom is not None:
+            for shingle in self._shingles(prompt):
+                self._bloom.add(shingle)
+
+        if self.index_dir:
+            self._save_index()
+
+    def _index_paths(self) -> Tuple[str, str, str]:
+        assert self.index_dir is not None
+        return (os.path.join(self.index_dir, "embeddings.npy"),
+                os.path.join(self.index_dir, "embeddings.scale.npy"),
+                os.path.join(self.index_dir, "embeddings.json"))
+
+    def _bloom_path(self) -> str:
+        assert self.index_dir is not None
+        return os.path.join(self.index_dir, "embeddings.bloom")
+
+    def _load_index(self) -> None:
+        matrix_path, scale_path, meta_path = self._index_paths()
+        try:
+            matrix = np.load(matrix_path)
+            if matrix.dtype == np.int8:
+                scale = np.load(scale_path).astype(np.float32, copy=False)
+            else:
+                # 양자화 이전에 저장된 float32 인덱스
+                matrix, scale = self._quantize(matrix.astype(np.float32, copy=False))
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not len(meta["keys"]) == len(matrix) == len(scale):
+            return
+
+        self._emb_q = matrix
+        self._emb_scale = scale
+        self._emb_keys = meta["keys"]
+        self._model_ids = meta["model_ids"]
+        self._emb_model_ids = np.asarray(meta["rows"], dtype=np.int32)
+        prompts = meta.get("prompts")
+        self._emb_prompts = prompts if prompts and len(prompts) == len(matrix) \
+            else [None] * len(matrix)
+
+        if self._bloom is not None:
+            self._load_bloom(meta.get("bloom_rows"))
+
+    def _load_bloom(self, bloom_rows: Optional[int]) -> None:
+        """저장된 필터가 모든 행을 담고 있으면 로드, 아니면 프롬프트로 재구성"""
+        if bloom_rows == len(self._emb_keys):
+            try:
+                with open(self._bloom_path(), "rb") as f:
+                    self._bloom = ScalableBloomFilter.fromfile(f)
+                return
+            except (OSError, ValueError):
+                pass
+        if any(p is None for p in self._emb_prompts):
+            self._bloom_complete = False
+            return
+        for prompt in self._emb_prompts:
+            for shingle in self._shingles(cast(str, prompt)):
+                self._bloom.add(shingle)
+
+    def _save_index(self) -> None:
+        if self._emb_q is None:
+            return
+        matrix_path, scale_path, meta_path = self._index_paths()
+        os.makedirs(os.path.dirname(matrix_path), exist_ok=True)
+        meta: Dict[str, Any] = {
+            "keys": self._emb_keys,
+            "model_ids": self._model_ids,
+            "rows": self._emb_model_ids.tolist(),
+            "prompts": self._emb_prompts,
+        }
+        # 필터는 모든 행을 담을 때만 저장하고, 담은 행 수를 메타에 기록
+        bloom = self._bloom if self._bloom_complete else None
+        if bloom is not None:
+            meta["bloom_rows"] = len(self._emb_keys)
+        try:
+            with open(f"{matrix_path}.tmp", "wb") as f:
+                np.save(f, self._emb_q)
+            with open(f"{scale_path}.tmp", "wb") as f:
+                np.save(f, self._emb_scale)
+            with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            if bloom is not None:
+                with open(f"{self._bloom_path()}.tmp", "wb") as f:
+                    bloom.tofile(f)
+            os.replace(f"{matrix_path}.tmp", matrix_path)
+            os.replace(f"{scale_path}.tmp", scale_path)
+            if bloom is not None:
+                os.replace(f"{self._bloom_path()}.tmp", self._bloom_path())
+            elif os.path.exists(self._bloom_path()):
+                # 이번 실행의 행을 담지 못한 필터는 남기지 않음
+                os.remove(self._bloom_path())
+            os.replace(f"{meta_path}.tmp", meta_path)
+        except OSError:
+            pass
+
+
+def _gemini_command(model: str, prompt: str) -> List[str]:
+    """일회성 gemini 실행 명령어"""
+    return ["gemini", "--model", model, "-p", prompt]
+
+
+class PromptBatcher:
+    """
+    DataLoader 방식 프롬프트 묶음 실행기
+
+    짧은 시간 창(BATCH_WINDOW_MS) 동안 들어온 요청을 최대 BATCH_SIZE개까지
+    모아 gemini 프로세스를 동시에 띄운다. 창이 길수록 한 번에 더 많이
+    묶이지만, 혼자 들어온 요청도 그만큼 늦게 출발한다 (50ms 정도면
+    사람이 체감하지 못하면서 동시 요청 대부분을 묶을 수 있다).
+    """
+
+    BATCH_SIZE: ClassVar[int] = 8
+    BATCH_WINDOW_MS: ClassVar[int] = 100
+
+    def __init__(self, batch_size: int = BATCH_SIZE,
+                 window_ms: int = BATCH_WINDOW_MS) -> None:
+        _import_asyncio()
+        self.batch_size = batch_size
+        self.window = window_ms / 1000
+        self._queue: Optional[Queue] = None
+        self._queue_loop: Optional[AbstractEventLoop] = None
+        self._loop: Optional[AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._tasks: Set[Task[None]] = set()
+
+    async def execute_async(self, model: str, prompt: str,
+                            timeout: int = 60) -> Dict:
+        """요청을 큐에 넣고 묶음 실행 결과를 기다림"""
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._queue_loop is not loop:
+            self._queue = asyncio.Queue()
+            self._queue_loop = loop
+            self._spawn(self._drain(self._queue))
+
+        future = loop.create_future()
+        await self._queue.put((model, prompt, timeout, future))
+        return await future
+
+    def execute(self, model: str, prompt: str, timeout: int = 60) -> Dict:
+        """동기 래퍼 (백그라운드 이벤트 루프에서 실행)"""
+        future = asyncio.run_coroutine_threadsafe(
+            self.execute_async(model, prompt, timeout), self._ensure_loop()
+        )
+        return future.result()
+
+    def close(self) -> None:
+        """백그라운드 이벤트 루프 종료"""
+        with self._lock:
+            if self._loop is not None and self._loop_thread is not None:
+                asyncio.run_coroutine_threadsafe(self._cancel_tasks(), self._loop).result()
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop_thread.join()
+                self._loop.close()
+                self._loop = None
+                self._loop_thread = None
+
+    def _ensure_loop(self) -> AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(target=self._loop.run_forever,
+                                                daemon=True)
+                self._loop_thread.start()
+                atexit.register(self.close)
+            return self._loop
+
+    async def _cancel_tasks(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _spawn(self, coro: Coroutine[Any, Any, None]) -> None:
+        # 태스크 참조를 유지해 실행 중 GC되지 않도록 함
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self, queue: Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            self._spawn(self._dispatch(batch))
+
+    async def _dispatch(self, batch: List[Tuple[str, str, int, Future[Dict]]]) -> None:
+        results = await asyncio.gather(
+            *(self._run(model, prompt, timeout) for model, prompt, timeout, _ in batch)
+        )
+        for (_, _, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _run(self, model: str, prompt: str, timeout: int) -> Dict:
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *_gemini_command(model, prompt),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                return {
+                    "success": False,
+                    "model": model,
+                    "error": f"Timeout after {timeout}s",
+                    "returncode": -1
+                }
+
+            return {
+                "success": proc.returncode == 0,
+                "model": model,
+                "output": stdout.decode("utf-8", errors="replace"),
+                "error": stderr.decode("utf-8", errors="replace"),
+                "returncode": proc.returncode
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "model": model,
+                "error": str(e),
+                "returncode": -1
+            }
+
+
+class _ProcessPool:
+    """
+    모델별 상주 워커 프로세스 풀
+
+    gemini CLI 자체에는 상주 모드가 없으므로, 아래 프로토콜을 구현한 워커
+    명령어를 받아 모델별로 하나씩 띄운다. 프롬프트를 JSON 한 줄
+    ({"prompt": ...})로 stdin에 쓰고, stdout에서 JSON 한 줄
+    ({"output": str, "error": str, "returncode": int}, output 필수)을 읽는다.
+
+    한 번도 응답하지 않은 워커가 시간 초과·종료·잘못된 응답을 내면
+    프로토콜을 모르는 것으로 보고 해당 모델은 풀에서 제외한다 (None 반환 →
+    일회성 실행으로 대체).
+    """
+
+    READ_CHUNK: ClassVar[int] = 65536
+    STDERR_TAIL_BYTES: ClassVar[int] = 64 * 1024
+
+    def __init__(self, command_factory: Callable[[str], List[str]]) -> None:
+        self._command_factory = command_factory
+        self._procs: Dict[str, subprocess.Popen] = {}
+        self._buffers: Dict[str, bytes] = {}
+        self._stderr: Dict[str, Deque[bytes]] = {}
+        self._replied: Set[str] = set()
+        self._disabled: Set[str] = set()
+        atexit.register(self.close)
+
+    def _get_process(self, model: str) -> subprocess.Popen:
+        proc = self._procs.get(model)
+        if proc is None or proc.poll() is not None:
+            proc = subprocess.Popen(
+                self._command_factory(model),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                bufsize=0
+            )
+            self._procs[model] = proc
+            self._buffers[model] = b""
+            # 할당량 메시지가 stderr로만 나올 수 있으므로 끝부분을 보관
+            tail: Deque[bytes] = deque()
+            self._stderr[model] = tail
+            threading.Thread(target=self._drain_stderr,
+                             args=(cast(IO[bytes], proc.stderr), tail),
+                             daemon=True).start()
+        return proc
+
+    @classmethod
+    def _drain_stderr(cls, pipe: IO[bytes], tail: Deque[bytes]) -> None:
+        size = 0
+        try:
+            for chunk in iter(lambda: os.read(pipe.fileno(), cls.READ_CHUNK), b""):
+                tail.append(chunk)
+                size += len(chunk)
+                while size - len(tail[0]) >= cls.STDERR_TAIL_BYTES:
+                    size -= len(tail.popleft())
+        except (OSError, ValueError):
+            pass
+
+    def _readline(self, model: str, proc: subprocess.Popen,
+                  timeout: float) -> Optional[bytes]:
+        """응답 한 줄 읽기 (EOF면 None, 시간 초과면 TimeoutExpired)"""
+        stdout = cast(IO[bytes], proc.stdout)
+        buf = self._buffers[model]
+        deadline = time.monotonic() + timeout
+        with selectors.DefaultSelector() as sel:
+            sel.register(stdout, selectors.EVENT_READ)
+            while b"\n" not in buf:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not sel.select(remaining):
+                    raise subprocess.TimeoutExpired(proc.args, timeout)
+                chunk = os.read(stdout.fileno(), self.READ_CHUNK)
+                if not chunk:
+                    return None
+                buf += chunk
+
+        line, _, self._buffers[model] = buf.partition(b"\n")
+        return line
+
+    def request(self, model: str, prompt: str, timeout: float) -> Optional[Dict]:
+        """
+        상주 프로세스로 프롬프트 실행
+
+        Returns:
+            결과 딕셔너리 (프로세스를 쓸 수 없으면 None → 일회성 실행으로 대체)
+        """
+        if model in self._disabled:
+            return None
+
+        try:
+            proc = self._get_process(model)
+            self._stderr[model].clear()
+            cast(IO[bytes], proc.stdin).write(_dumps({"prompt": prompt}) + b"\n")
+            line = self._readline(model, proc, timeout)
+        except subprocess.TimeoutExpired:
+            if model not in self._replied:
+                self._give_up(model)
+                return None
+            self._kill(model)
+            return {
+                "success": False,
+                "model": model,
+                "error": f"Timeout after {timeout}s",
+                "returncode": -1
+            }
+        except OSError:
+            self._give_up(model)
+            return None
+
+        try:
+            payload = json.loads(line) if line is not None else None
+        except ValueError:
+            payload = None
+        if not self._valid_reply(payload):
+            # 요청을 그대로 되돌려주는 워커(cat 등)도 여기서 걸러짐
+            self._give_up(model)
+            return None
+
+        self._replied.add(model)
+        stderr_text = b"".join(self._stderr.get(model, ())).decode("utf-8", errors="replace")
+        returncode = payload.get("returncode", 1 if payload.get("error") else 0)
+        return {
+            "success": returncode == 0,
+            "model": model,
+            "output": payload["output"],
+            "error": payload.get("error") or stderr_text,
+            "returncode": returncode
+        }
+
+    @staticmethod
+    def _valid_reply(payload: Any) -> TypeGuard[Dict[str, Any]]:
+        """output이 문자열이고, error/returncode가 있으면 각각 문자열/정수인 응답만 허용"""
+        if not isinstance(payload, dict) or not isinstance(payload.get("output"), str):
+            return False
+        returncode = payload.get("returncode", 0)
+        if not isinstance(returncode, int) or isinstance(returncode, bool):
+            return False
+        return payload.get("error") is None or isinstance(payload["error"], str)
+
+    def _give_up(self, model: str) -> None:
+        """프로세스를 종료하고, 한 번도 응답한 적 없으면 풀에서 제외"""
+        self._kill(model)
+        if model not in self._replied:
+            self._disabled.add(model)
+
+    def _kill(self, model: str) -> None:
+        proc = self._procs.pop(model, None)
+        self._buffers.pop(model, None)
+        self._stderr.pop(model, None)
+        if proc is not None:
+            proc.kill()
+            proc.wait()
+            for pipe in (proc.stdin, proc.stdout, proc.stderr):
+                if pipe is not None:
+                    pipe.close()
+
+    def close(self) -> None:
+        """모든 상주 프로세스 종료"""
+        for model in list(self._procs):
+            self._kill(model)
+
 
 class GeminiModelFallback:
     """Gemini 모델 자동 전환 시스템"""
 
     # 모델 우선순위 (Pro → Flash → Preview → Lite)
-    MODEL_PRIORITIES = [
+    MODEL_PRIORITIES: ClassVar[Tuple[str, ...]] = (
         "gemini-2.5-pro",
         "gemini-2.5-flash",
         "gemini-2.5-flash-preview-09-2025",
         "gemini-2.5-flash-lite",
         "gemini-1.5-pro",
         "gemini-1.5-flash",
-    ]
+    )
+    _MODEL_SET: ClassVar[FrozenSet[str]] = frozenset(MODEL_PRIORITIES)
 
     # 마스터 에이전트 인계 트리거
-    MAX_RETRIES_PER_MODEL = 3
-    TOTAL_CYCLE_LIMIT = 3  # 전체 사이클 제한
+    MAX_RETRIES_PER_MODEL: ClassVar[int] = 3
+    TOTAL_CYCLE_LIMIT: ClassVar[int] = 3  # 전체 사이클 제한
+
+    # 재시도 대기 (지수 백오프 + 지터, 초)
+    BACKOFF_BASE: ClassVar[float] = 0.5
+    BACKOFF_CAP: ClassVar[float] = 30.0
+    BACKOFF_JITTER: ClassVar[float] = 0.2
+    # Retry-After 힌트를 따를 최대 대기 (초, 더 긴 힌트는 여기까지만 대기)
+    RETRY_AFTER_CAP: ClassVar[float] = 120.0
+
+    # 스트리밍 실행 시 보관할 stderr 최대 길이 (에러 분류에는 끝부분이면 충분)
+    STDERR_TAIL_CHARS: ClassVar[int] = 64 * 1024
+
+    # 할당량 에러 분류 시 보는 stderr 앞/뒤 길이 (메시지는 첫 줄이나 마지막 줄에 나옴)
+    CLASSIFY_EDGE_CHARS: ClassVar[int] = 256
+
+    # 재시도를 소진한 모델의 쿨다운 (초, 한 execute() 호출 안에서 소진할 때마다 다음 단계)
+    COOLDOWN_SCHEDULE: ClassVar[Tuple[int, ...]] = (5, 30, 120, 600)
+
+    # 할당량 에러 패턴 (대소문자 무시, 1회 스캔)
+    _QUOTA_RE: ClassVar[re.Pattern[str]] = re.compile(
+        r"quota|Quota exceeded|limit|429|rate limit", re.IGNORECASE
+    )
+    # Retry-After는 초 단위 숫자만 인정 (날짜·시각·분/시간 단위 값은 무시)
+    _RETRY_AFTER_RE: ClassVar[re.Pattern[str]] = re.compile(
+        r"""retry[- _]after["']?\s*[:=]?\s*["']?(\d+(?:\.\d+)?)"""
+        r"(?![\d.:/-]|\s*(?:ms|mi|h|d)[a-z]*\b)",
+        re.IGNORECASE
+    )
+    # 일일 할당량 소진 패턴 (예: quotaId: GenerateRequestsPerDayPerProjectPerModel)
+    _DAILY_QUOTA_RE: ClassVar[re.Pattern[str]] = re.compile(
+        r"daily (?:limit|quota)|quota_?metric.*per[ _-]?day|requests_?per_?day",
+        re.IGNORECASE
+    )
 
-    def __init__(self, master_mode: bool = False):
+    def __init__(self, master_mode: bool = False,
+                 cache: Optional[LLMCache] = None,
+                 worker_command: Optional[List[str]] = None,
+                 batcher: Optional[PromptBatcher] = None) -> None:
         """
         초기화
 
         Args:
             master_mode: True면 마스터 에이전트 모드 (직접 사용자에게 인계)
+            cache: 응답 캐시 (None이면 캐시 사용 안 함)
+            worker_command: 모델별로 상주시킬 JSON-lines 워커 명령어
+                ("{model}"은 모델명으로 치환, None이면 매번 gemini 실행)
+            batcher: 여러 핸들러가 공유하는 묶음 실행기 (None이면 개별 실행)
         """
         self.master_mode = master_mode
-        self.current_model_index = 0
-        self.retry_count = 0
-        self.cycle_count = 0
+        self.cache = cache
+        self._pool: Optional[_ProcessPool] = None
+        if worker_command:
+            self._pool = _ProcessPool(
+                lambda model: [arg.replace("{model}", model) for arg in worker_command]
+            )
+        self._batcher = batcher
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0}
+        self._reset_state()
+        self._rng: Optional[random.Random] = None
+        self._model_cooldown_until: Dict[str, float] = {}
+        self._model_exhaustions: Dict[str, int] = {}
+        self._dead_models: Set[str] = set()
+
+    def _reset_state(self) -> None:
+        """전환 카운터만 초기화 (캐시·프로세스 풀·쿨다운은 유지)"""
+        self._state: int = 0
+
+    # 모델 인덱스/재시도/사이클 카운터를 _state 한 정수에 8비트씩 묶어 보관
+    # (bits 0-7: 모델 인덱스, 8-15: 재시도, 16-23: 사이클)
+    def _get_field(self, shift: int) -> int:
+        return (self._state >> shift) & 0xFF
+
+    def _set_field(self, shift: int, value: int) -> None:
+        if not 0 <= value <= 0xFF:
+            raise ValueError(f"counter out of range: {value}")
+        self._state = (self._state & ~(0xFF << shift)) | (value << shift)
+
+    @property
+    def current_model_index(self) -> int:
+        return self._state & 0xFF
+
+    @current_model_index.setter
+    def current_model_index(self, value: int) -> None:
+        self._set_field(0, value)
 
-    def get_available_models(self) -> List[str]:
-        """사용 가능한 모델 리스트 반환"""
-        return self.MODEL_PRIORITIES.copy()
+    @property
+    def retry_count(self) -> int:
+        return self._get_field(8)
+
+    @retry_count.setter
+    def retry_count(self, value: int) -> None:
+        self._set_field(8, value)
+
+    @property
+    def cycle_count(self) -> int:
+        return self._get_field(16)
+
+    @cycle_count.setter
+    def cycle_count(self, value: int) -> None:
+        self._set_field(16, value)
+
+    def get_available_models(self) -> Tuple[str, ...]:
+        """사용 가능한 모델 목록 반환 (불변 튜플)"""
+        return self.MODEL_PRIORITIES
+
+    def get_cache_stats(self) -> Dict[str, int]:
+        """캐시 적중/미스 통계 반환"""
+        return dict(self.stats)
 
     def get_current_model(self) -> str:
         """현재 모델 반환"""
         return self.MODEL_PRIORITIES[self.current_model_index]
 
-    def _check_quota_error(self, error_output: str) -> bool:
-        """할당량 에러 확인"""
-        quota_indicators = [
-            "quota",
-            "Quota exceeded",
-            "limit",
-            "429",
-            "rate limit"
+    def get_status(self) -> Dict[str, Any]:
+        """현재 전환 상태 및 모델별 남은 쿨다운(초) 반환"""
+        now = time.monotonic()
+        return {
+            "current_model": self.get_current_model(),
+            "model_index": self.current_model_index,
+            "retry_count": self.retry_count,
+            "cycle_count": self.cycle_count,
+            "cooldowns": {
+                model: until - now
+                for model, until in self._model_cooldown_until.items()
+                if until > now
+            },
+            "dead_models": [m for m in self.MODEL_PRIORITIES if m in self._dead_models],
+        }
+
+    def _start_cooldown(self, model: str) -> float:
+        """재시도를 소진한 모델에 쿨다운 설정 (소진할수록 길어짐)"""
+        exhaustions = self._model_exhaustions.get(model, 0)
+        self._model_exhaustions[model] = exhaustions + 1
+        cooldown = self.COOLDOWN_SCHEDULE[min(exhaustions, len(self.COOLDOWN_SCHEDULE) - 1)]
+        self._model_cooldown_until[model] = time.monotonic() + cooldown
+        return cooldown
+
+    def _select_model(self, verbose: bool = True) -> str:
+        """
+        쿨다운 중이거나 일일 할당량이 소진된 모델을 건너뛰고 다음 시도할 모델 선택
+
+        남은 모델이 모두 쿨다운 중이면 가장 먼저 풀리는 모델까지 대기한다
+        (최대 BACKOFF_CAP초, 그 뒤에는 쿨다운이 남아 있어도 시도).
+        살아 있는 모델이 하나 이상 있을 때만 호출해야 한다 (execute()가 먼저 확인).
+        """
+        now = time.monotonic()
+        candidates = [
+            i for i in range(self.current_model_index, len(self.MODEL_PRIORITIES))
+            if self.MODEL_PRIORITIES[i] not in self._dead_models
+        ] or [
+            i for i in range(len(self.MODEL_PRIORITIES))
+            if self.MODEL_PRIORITIES[i] not in self._dead_models
         ]
-        return any(indicator in error_output.lower() for indicator in quota_indicators)
+        if not candidates:
+            raise RuntimeError("all models are exhausted for today")
+        for index in candidates:
+            if self._model_cooldown_until.get(self.MODEL_PRIORITIES[index], 0) <= now:
+                break
+        else:
+            index = min(candidates,
+                        key=lambda i: self._model_cooldown_until[self.MODEL_PRIORITIES[i]])
+            wait = min(self.BACKOFF_CAP,
+                       self._model_cooldown_until[self.MODEL_PRIORITIES[index]] - now)
+            if verbose:
+                _log.debug("⏸️  All models cooling down, waiting %.1fs for %s",
+                           wait, self.MODEL_PRIORITIES[index])
+            time.sleep(max(0.0, wait))
+
+        if index != self.current_model_index:
+            self.current_model_index = index
+            self.retry_count = 0
+        return self.get_current_model()
+
+    def _check_daily_quota(self, error_output: str) -> bool:
+        """일일 할당량 소진 여부 확인 (이번 실행 동안 모델 제외)"""
+        return bool(self._DAILY_QUOTA_RE.search(error_output))
+
+    def _check_quota_error(self, error_output: str) -> bool:
+        """할당량 에러 확인 (긴 stderr는 앞/뒤 CLASSIFY_EDGE_CHARS자만 검사)"""
+        n = self.CLASSIFY_EDGE_CHARS
+        if len(error_output) > 2 * n:
+            # 캐시 키와 검사 범위를 함께 제한 (전체 stderr를 캐시에 붙잡아 두지 않음)
+            error_output = error_output[:n] + "\n" + error_output[-n:]
+        return self._classify_err_cached(error_output)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=128)
+    def _classify_err_cached(error_edges: str) -> bool:
+        # 같은 429 메시지가 사이클마다 반복되므로 분류 결과를 재사용
+        return bool(GeminiModelFallback._QUOTA_RE.search(error_edges))
+
+    def _backoff(self, attempt: int) -> float:
+        """지수 백오프 대기 시간 계산 (양의 지터 포함)"""
+        if self._rng is None:
+            self._rng = random.Random()
+        delay = min(self.BACKOFF_CAP, self.BACKOFF_BASE * 2 ** attempt)
+        return delay * (1 + self._rng.uniform(0, self.BACKOFF_JITTER))
+
+    def _retry_delay(self, attempt: int, error_output: str) -> float:
+        """Retry-After 힌트가 있으면 백오프와 비교해 더 긴 쪽 사용 (최대 RETRY_AFTER_CAP초)"""
+        delay = self._backoff(attempt)
+        match = self._RETRY_AFTER_RE.search(error_output or "")
+        if match:
+            delay = max(min(float(match.group(1)), self.RETRY_AFTER_CAP), delay)
+        return delay
 
     def _execute_with_model(self, model: str, prompt: str,
                            timeout: int = 60) -> Dict:
-        """특정 모델로 명령어 실행"""
-        cmd = ["gemini", "--model", model, "-p", prompt]
+        """특정 모델로 명령어 실행 (캐시 조회는 execute()가 모델 선택 전에 수행)"""
+        response = None
+        if self._pool is not None:
+            response = self._pool.request(model, prompt, timeout)
+        if response is None:
+            if self._batcher is not None:
+                response = self._batcher.execute(model, prompt, timeout)
+            else:
+                response = self._run_once(model, prompt, timeout)
+
+        if self.cache is not None and response["returncode"] == 0:
+            # 호출자가 결과를 수정해도 캐시 항목은 그대로 유지
+            self.cache.store(model, prompt, dict(response))
+        return response
+
+    def _lookup_cache(self, prompt: str) -> Optional[Dict]:
+        """우선순위 순으로 모든 모델의 캐시 조회 (모델 선택·쿨다운 대기 전에 호출)"""
+        if self.cache is None:
+            return None
+        for model in self.MODEL_PRIORITIES:
+            cached = self.cache.lookup(model, prompt)
+            if cached is not None:
+                self.stats["hits"] += 1
+                return dict(cached)
+        self.stats["misses"] += 1
+        return None
+
+    def _run_once(self, model: str, prompt: str, timeout: int) -> Dict:
+        """gemini 프로세스를 한 번 실행 (스트림 출력을 모아서 반환)"""
+        chunks = []
+        stream = self._execute_with_model_stream(model, prompt, timeout)
+        while True:
+            try:
+                chunks.append(next(stream))
+            except StopIteration as stop:
+                result = stop.value
+                break
+
+        result["output"] = "".join(chunks)
+        return result
+
+    def _execute_with_model_stream(self, model: str, prompt: str,
+                                   timeout: int = 60) -> Generator[str, None, Dict]:
+        """
+        gemini 출력을 줄 단위로 스트리밍
 
+        Yields:
+            stdout 한 줄씩
+
+        Returns:
+            output을 제외한 결과 딕셔너리 (StopIteration.value)
+        """
         try:
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=timeout
+            proc = subprocess.Popen(
+                _gemini_command(model, prompt),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                encoding="utf-8",
+                errors="replace",
+                bufsize=1
             )
-
+        except Exception as e:
             return {
-                "success": result.returncode == 0,
+                "success": False,
                 "model": model,
-                "output": result.stdout,
-                "error": result.stderr,
-                "returncode": result.returncode
+                "error": str(e),
+                "returncode": -1
             }
-        except subprocess.TimeoutExpired:
+
+        # stderr는 별도 스레드에서 마지막 STDERR_TAIL_CHARS만 유지
+        stderr_tail: Deque[str] = deque()
+        stdout = cast(IO[str], proc.stdout)
+        stderr_reader = threading.Thread(
+            target=self._drain_stderr, args=(proc.stderr, stderr_tail), daemon=True
+        )
+        stderr_reader.start()
+
+        timed_out = threading.Event()
+
+        def _on_timeout() -> None:
+            timed_out.set()
+            proc.kill()
+
+        read_error: Optional[str] = None
+        timer = threading.Timer(timeout, _on_timeout)
+        timer.start()
+        try:
+            while True:
+                try:
+                    line = stdout.readline()
+                except Exception as e:
+                    read_error = str(e)
+                    proc.kill()
+                    break
+                if not line:
+                    break
+                yield line
+            proc.wait()
+        finally:
+            timer.cancel()
+            if proc.poll() is None:
+                # 호출자가 중간에 스트림을 닫은 경우
+                proc.kill()
+                proc.wait()
+            stdout.close()
+            stderr_reader.join()
+
+        if timed_out.is_set():
             return {
                 "success": False,
                 "model": model,
                 "error": f"Timeout after {timeout}s",
                 "returncode": -1
             }
-        except Exception as e:
+        if read_error is not None:
             return {
                 "success": False,
                 "model": model,
-                "error": str(e),
+                "error": read_error,
                 "returncode": -1
             }
 
+        return {
+            "success": proc.returncode == 0,
+            "model": model,
+            "error": "".join(stderr_tail),
+            "returncode": proc.returncode
+        }
+
+    @classmethod
+    def _drain_stderr(cls, pipe: IO[str], tail: Deque[str]) -> None:
+        size = 0
+        try:
+            for chunk in iter(lambda: pipe.read(4096), ""):
+                tail.append(chunk)
+                size += len(chunk)
+                while size - len(tail[0]) >= cls.STDERR_TAIL_CHARS:
+                    size -= len(tail.popleft())
+        except (OSError, ValueError):
+            pass
+        finally:
+            pipe.close()
+
     def _fallback_to_next_model(self) -> bool:
-        """다음 모델로 전환"""
-        if self.current_model_index < len(self.MODEL_PRIORITIES) - 1:
-            self.current_model_index += 1
-            self.retry_count = 0
-            return True
+        """다음 모델로 전환 (일일 할당량이 소진된 모델은 건너뜀)"""
+        for index in range(self.current_model_index + 1, len(self.MODEL_PRIORITIES)):
+            if self.MODEL_PRIORITIES[index] not in self._dead_models:
+                self.current_model_index = index
+                self.retry_count = 0
+                return True
         return False
 
     def _reset_cycle(self) -> bool:
@@ -113,35 +1176,48 @@ class GeminiModelFallback:
 
     def _notify_master(self, last_error: str) -> str:
         """마스터 에이전트(Claude)에게 인계"""
-        import datetime
-
-        current_hour = datetime.datetime.now().hour
-        hours_until_reset = 24 - current_hour
-
-        message = f"""
-╔══════════════════════════════════════════════════════════╗
-║  🔴 GEMINI MODEL FALLBACK - MASTER AGENT NOTIFICATION           ║
-╚══════════════════════════════════════════════════════════╝
+        now = _dt.datetime.now(_PT)
+        midnight = (now + _dt.timedelta(days=1)).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        # 같은 tzinfo끼리 빼면 DST 변화가 무시되므로 타임스탬프로 계산
+        hours_until_reset = (midnight.timestamp() - now.timestamp()) / 3600
 
-All Gemini models have been exhausted after {self.cycle_count} cycle(s).
+        return _BANNER_TEMPLATE.format(
+            cycles=self.cycle_count,
+            model=self.get_current_model(),
+            model_count=len(self.MODEL_PRIORITIES),
+            max_retries=self.MAX_RETRIES_PER_MODEL,
+            last_error=last_error[:150],
+            hours_until_reset=hours_until_reset
+        )
 
-Current Status:
-  - Last attempted model: {self.get_current_model()}
-  - Total models tried: {len(self.MODEL_PRIORITIES)}
-  - Retry attempts per model: {self.MAX_RETRIES_PER_MODEL}
-  - Last error: {last_error[:150]...}
+    def _handoff(self, last_error: str) -> Optional[Dict]:
+        """
+        마스터 인계 (master_mode면 사용자에게 재시도 여부 확인)
 
-Recommendations:
-  1. Check API key quota at https://aistudio.google.com/app/apikey
-  2. Wait for quota reset (daily at midnight Pacific Time)
-  3. Upgrade to paid plan for higher limits
-  4. Consider using Claude directly (which you're using now!)
+        Returns:
+            실패 결과 딕셔너리 (사용자가 재시도를 선택하면 None)
+        """
+        # 배너는 stderr로 (stdout에는 결과만)
+        _log.warning(self._notify_master(last_error))
 
-Time until reset: Approximately {hours_until_reset} hours
+        if self.master_mode:
+            # 대화형 인계
+            user_input = input("\nPress Enter to exit or type 'retry' to start over: ")
+            if user_input.lower() == 'retry':
+                self._reset_state()
+                self._dead_models.clear()
+                return None
 
-Fallback system terminating. Master agent (Claude) should handle this task.
-"""
-        return message
+        # 다음 execute() 호출이 소진된 카운터를 이어받지 않도록 초기화
+        self._reset_state()
+        return {
+            "success": False,
+            "error": "All models exhausted. Master handoff required.",
+            "models_attempted": self.MODEL_PRIORITIES,
+            "last_error": last_error
+        }
 
     def execute(self, prompt: str, timeout: int = 60,
                 verbose: bool = True) -> Dict:
@@ -151,85 +1227,117 @@ Fallback system terminating. Master agent (Claude) should handle this task.
         Args:
             prompt: 실행할 프롬프트
             timeout: 타임아웃 (초)
-            verbose: 진행 상황 출력
+            verbose: 진행 상황 로깅 (gemini_fallback 로거, DEBUG 레벨)
 
         Returns:
             결과 딕셔너리
         """
+        # 캐시된 응답은 쿨다운·소진 여부와 관계없이 대기 없이 반환
+        cached = self._lookup_cache(prompt)
+        if cached is not None:
+            if verbose:
+                _log.debug("💾 Cache hit (model: %s)", cached.get("model"))
+            cached["fallback_used"] = False
+            cached["cycles"] = 0
+            return cached
+
+        # 쿨다운 단계는 호출마다 처음부터 (오래 도는 프로세스에서 최장 쿨다운에 머물지 않도록)
+        self._model_exhaustions.clear()
+        last_error = "Daily quota exhausted for all models"
         while True:
-            current_model = self.get_current_model()
+            if len(self._dead_models) >= len(self.MODEL_PRIORITIES):
+                # 모든 모델 소진 (이전 호출 포함) - 선택·대기 없이 바로 마스터 인계
+                handoff = self._handoff(last_error)
+                if handoff is None:
+                    continue
+                return handoff
+
+            current_model = self._select_model(verbose)
 
             if verbose:
-                print(f"🤖 Attempting model: {current_model}")
-                print(f"   Cycle {self.cycle_count + 1}/{self.TOTAL_CYCLE_LIMIT}")
-                print(f"   Retry {self.retry_count + 1}/{self.MAX_RETRIES_PER_MODEL}")
-                print(f"   Model index: {self.current_model_index + 1}/{len(self.MODEL_PRIORITIES)}")
+                _log.debug(
+                    "🤖 Attempting model: %s\n"
+                    "   Cycle %d/%d\n"
+                    "   Retry %d/%d\n"
+                    "   Model index: %d/%d",
+                    current_model,
+                    self.cycle_count + 1, self.TOTAL_CYCLE_LIMIT,
+                    self.retry_count + 1, self.MAX_RETRIES_PER_MODEL,
+                    self.current_model_index + 1, len(self.MODEL_PRIORITIES)
+                )
 
             result = self._execute_with_model(current_model, prompt, timeout)
 
             # 성공
             if result["success"]:
                 if verbose:
-                    print(f"✅ Success with model: {current_model}")
+                    _log.debug("✅ Success with model: %s", current_model)
+
+                # 리셋 전에 전환 여부 기록
+                fallback_used = self.cycle_count > 0 or self.current_model_index > 0
+                cycles = self.cycle_count
 
                 # 상태 리셋
-                self.cycle_count = 0
-                self.current_model_index = 0
-                self.retry_count = 0
+                self._reset_state()
 
-                return {
-                    **result,
-                    "fallback_used": self.cycle_count > 0 or self.current_model_index > 0,
-                    "cycles": self.cycle_count
-                }
+                result["fallback_used"] = fallback_used
+                result["cycles"] = cycles
+                return result
 
             # 실패 분석
             if self._check_quota_error(result.get("error", "")):
                 # 할당량 에러 - 재시도 또는 다음 모델
                 if verbose:
-                    print(f"⚠️  Quota error with {current_model}")
+                    _log.debug("⚠️  Quota error with %s", current_model)
+
+                daily_exhausted = self._check_daily_quota(result["error"])
+                if daily_exhausted:
+                    # 일일 할당량 소진 - 이번 실행 동안 다시 시도하지 않음
+                    self._dead_models.add(current_model)
+                    if verbose:
+                        _log.debug("💀 Daily quota exhausted for %s, skipping it from now on",
+                                   current_model)
+                    if len(self._dead_models) >= len(self.MODEL_PRIORITIES):
+                        # 루프 맨 앞에서 대기 없이 바로 마스터 인계
+                        last_error = result["error"]
+                        continue
 
                 self.retry_count += 1
 
-                if self.retry_count >= self.MAX_RETRIES_PER_MODEL:
+                if daily_exhausted or self.retry_count >= self.MAX_RETRIES_PER_MODEL:
                     # 현재 모델 재시도 횟수 정하면 다음 모델로
-                    if verbose:
-                        print(f"🔄 Max retries reached for {current_model}")
+                    if not daily_exhausted:
+                        cooldown = self._start_cooldown(current_model)
+                        if verbose:
+                            _log.debug("🔄 Max retries reached for %s (cooldown %ss)",
+                                       current_model, cooldown)
 
                     if not self._fallback_to_next_model():
                         # 모든 모델 시도 실패
                         if not self._reset_cycle():
                             # 사이클 리밋도 실패하면 마스터 인계
-                            error_msg = self._notify_master(result["error"])
-                            print(error_msg)
-
-                            if self.master_mode:
-                                # 대화형 인계
-                                user_input = input("\nPress Enter to exit or type 'retry' to start over: ")
-                                if user_input.lower() == 'retry':
-                                    self.__init__(master_mode=True)
-                                    continue
-
-                            return {
-                                "success": False,
-                                "error": "All models exhausted. Master handoff required.",
-                                "models_attempted": self.MODEL_PRIORITIES,
-                                "last_error": result["error"]
-                            }
-                    else:
+                            handoff = self._handoff(result["error"])
+                            if handoff is None:
+                                continue
+                            return handoff
+
+                        delay = self._retry_delay(self.cycle_count - 1, result["error"])
                         if verbose:
-                            print(f"🔄 Cycling back to first model (cycle {self.cycle_count + 1})")
-                        time.sleep(2)  # 잠시 후 재시도
-                        continue
+                            _log.debug("🔄 Cycling back to first model (cycle %d) in %.1fs",
+                                       self.cycle_count + 1, delay)
+                        time.sleep(delay)  # 잠시 후 재시도
+                    # 다음 모델은 할당량이 별도이므로 대기 없이 바로 시도
+                    continue
                 else:
+                    delay = self._retry_delay(self.retry_count - 1, result["error"])
                     if verbose:
-                        print(f"⏳ Retrying {current_model} in 5 seconds...")
-                    time.sleep(5)
+                        _log.debug("⏳ Retrying %s in %.1f seconds...", current_model, delay)
+                    time.sleep(delay)
                     continue
             else:
                 # 다른 에러 - 바로 인계
-                error_msg = self._notify_master(result["error"])
-                print(error_msg)
+                _log.warning(self._notify_master(result["error"]))
+                self._reset_state()
 
                 return {
                     "success": False,
@@ -239,9 +1347,14 @@ Fallback system terminating. Master agent (Claude) should handle this task.
 
 
 # CLI 인터페이스
-def main():
-    """CLI 엔트리 포인트"""
-    import argparse
+_PARSER: Optional[argparse.ArgumentParser] = None
+
+
+def _get_parser() -> argparse.ArgumentParser:
+    """CLI 파서 반환 (첫 호출 시 한 번만 생성)"""
+    global _PARSER
+    if _PARSER is not None:
+        return _PARSER
 
     parser = argparse.ArgumentParser(
         description="Gemini Model Fallback Handler"
@@ -265,10 +1378,64 @@ def main():
         help="Verbose output"
     )
 
+    parser.add_argument(
+        "--persistent",
+        metavar="CMD",
+        help="Keep one worker per model alive and pipe prompts to it as JSON lines. "
+             "CMD must speak that protocol (the gemini CLI itself does not); "
+             "'{model}' is replaced with the model name"
+    )
+
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Cache successful responses on disk (~/.cache/gemini-fallback)"
+    )
+
+    parser.add_argument(
+        "--semantic",
+        action="store_true",
+        help="Also reuse cached responses for near-duplicate prompts "
+             "(implies --cache; requires numpy and sentence-transformers)"
+    )
+
+    parser.add_argument(
+        "--semantic-bloom",
+        action="store_true",
+        help="Skip the embedding lookup for prompts a Bloom filter rules out "
+             "(implies --semantic; requires pybloom-live)"
+    )
+
+    _PARSER = parser
+    return parser
+
+
+def main() -> None:
+    """CLI 엔트리 포인트"""
+    parser = _get_parser()
     args = parser.parse_args()
 
+    # 진행 상황은 stderr로 보내 stdout에는 모델 출력만 남김
+    # (루트는 WARNING으로 두어 asyncio 등 다른 로거의 DEBUG 출력은 숨김)
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr, format="%(message)s")
+    _log.setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+
     # Fallback 핸들러 초기화
-    handler = GeminiModelFallback(master_mode=(args.mode == "master"))
+    cache: Optional[LLMCache] = None
+    if args.cache or args.semantic or args.semantic_bloom:
+        backend = FileCacheBackend()
+        if args.semantic or args.semantic_bloom:
+            try:
+                cache = SemanticCache(backend, index_dir=backend.directory,
+                                      bloom=args.semantic_bloom)
+            except ImportError as e:
+                parser.error(str(e))
+        else:
+            cache = LLMCache(backend)
+    handler = GeminiModelFallback(master_mode=(args.mode == "master"),
+                                  cache=cache,
+                                  worker_command=(shlex.split(args.persistent)
+                                                  if args.persistent else None))
 
     # 실행
     result = handler.execute(args.prompt, verbose=args.verbose)